@@ -1,8 +1,8 @@
+import os
+import sys
 import zipfile
 from xml.etree import ElementTree
 from html import escape
-import re
-import copy
 from warnings import warn
 
 namespaces = {
@@ -17,23 +17,36 @@ namespaces = {
     'http://schemas.openxmlformats.org/officeDocument/2006/relationships': 'r'
 }
 
+wml_prefix = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+_shortened = {}
+
 def shorten(name):
-    if name[:1] == '{':
+    # A document has only a few dozen distinct tag and attribute names, and
+    # this is called for nearly every element, so cache the results.
+    try:
+        return _shortened[name]
+    except KeyError:
+        pass
+
+    short = name
+    if name.startswith(wml_prefix):
+        # The main WordprocessingML namespace is by far the most common.
+        short = name[len(wml_prefix):]
+    elif name[:1] == '{':
         end = name.index('}')
         schema = name[1:end]
         v = namespaces.get(schema)
-        if v is None:
-            return name
-        elif v == '':
-            return name[end + 1:]
-        else:
-            return v + ':' + name[end + 1:]
-    else:
-        return name
+        if v == '':
+            short = name[end + 1:]
+        elif v is not None:
+            short = v + ':' + name[end + 1:]
+    _shortened[name] = short
+    return short
 
 def bloat(name):
     assert ':' not in name
-    return '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}' + name
+    return wml_prefix + name
 
 k_val = bloat('val')
 k_ascii = bloat('ascii')
@@ -45,189 +58,270 @@ k_color = bloat('color')
 k_left = bloat('left')
 k_hanging = bloat('hanging')
 k_firstLine = bloat('firstLine')
+k_del = bloat('del')
+
+# Attributes that may appear on a w:rFonts element.
+font_keys = frozenset([
+    k_ascii, bloat('asciiTheme'),
+    k_hAnsi, bloat('hAnsiTheme'),
+    k_cs, bloat('cstheme'),
+    k_eastAsia, bloat('eastAsiaTheme'),
+    bloat('hint')
+])
+
+# How to render the fonts named in w:rFonts elements. Fonts not listed here
+# are used as is.
+font_families = {
+    'Symbol': None,  # appears once in the document, superfluous
+    'Mistral': None,  # fanciful, drop it
+    'Courier New': 'monospace',
+    'Arial': 'sans-serif',
+    'ArialMT': 'sans-serif',
+    'Arial Unicode MS': 'sans-serif',
+    'Helvetica': 'sans-serif',
+    'CG Times': 'Times New Roman',
+    'Times': 'Times New Roman',
+    'Tms Rmn': 'Times New Roman',
+}
+
+# Child elements of w:tcBorders and w:tblBorders: (tag, CSS property).
+border_sides = [(bloat(side), ('-ooxml-border-' if side.startswith('inside') else 'border-') + side)
+                for side in ('top', 'bottom', 'left', 'right', 'insideH', 'insideV')]
 
+hex_digits = frozenset('0123456789abcdefABCDEF')
 
 def parse_color(s):
-    if s is not None and re.match(r'^[0-9a-fA-F]{6}$', s):
+    if s is not None and len(s) == 6 and hex_digits.issuperset(s):
         return '#' + s
     else:
         return None
 
-def parse_pr(e):
-    font_keys = {
-        k_ascii, bloat('asciiTheme'),
-        k_hAnsi, bloat('hAnsiTheme'),
-        k_cs, bloat('cstheme'),
-        k_eastAsia, bloat('eastAsiaTheme'),
-        bloat('hint')
-    }
+# parse_pr handlers for the child elements of w:pPr, w:rPr, and similar
+# elements. Each one is called as handler(e, k, put), where e is the
+# properties element, k is the child, and put(css_prop, value) sets a CSS
+# property. Children with no handler are ignored. The table is keyed by the
+# full Clark-notation tag, so dispatching doesn't need shorten().
+#
+# TODO: caps, smallCaps, vanish, u, sz
+# todo: jc, spacing, contextualSpacing
+# todo: pBdr
+pr_handlers = {}
+
+def pr_handler(*names):
+    def register(fn):
+        for name in names:
+            pr_handlers[bloat(name)] = fn
+        return fn
+    return register
+
+@pr_handler('i')
+def pr_italic(e, k, put):
+    if not k.attrib:
+        put('font-style', 'italic')
+
+@pr_handler('b')
+def pr_bold(e, k, put):
+    if not k.attrib:
+        put('font-weight', 'bold')
+
+@pr_handler('rFonts')
+def pr_fonts(e, k, put):
+    # ascii, hAnsi, cs, and eastAsia are four different fixed subsets
+    # of the Unicode character set. A single w:rFonts element can
+    # contain all four, and the corresponding run of text is rendered
+    # using one of four fonts, for each character, depending on which
+    # subset that character falls into.
+    #
+    # We don't implement any of that, because for any given w:rFonts
+    # element, it seems the same font is specified for all the
+    # attributes that are actually defined. (There is only one
+    # exception in the document; we ignore it.)
+    #
+    # It's unclear what is supposed to happen when one or more of the
+    # four attributes is missing.
+    #
+    # In addition there are four more possible attributes: asciiTheme,
+    # hAnsiTheme, cstheme, eastAsiaTheme.  Handling these correctly
+    # apparently requires you to parse a whole extra file, theme1.xml.
+
+    # These are the fonts mentioned in rFonts elements in the Language
+    # Specification, including both document.xml and styles.xml:
+    #   Arial, Arial Unicode MS, ArialMT, CG Times, Century,
+    #   Courier New, Garamond, Geneva, Helvetica, MS Gothic,
+    #   Mistral, Symbol, Tahoma, Times, Times New Roman, Tms Rmn,
+    #   Verdana, Wingdings
+
+    assert font_keys.issuperset(k.attrib)
+    font = k.get(k_ascii) or k.get(k_cs)
+    if font is not None:
+        assert k.get(k_ascii, font) == font
+        hAnsiFont = k.get(k_hAnsi, font)
+        if hAnsiFont != font:
+            warn("rFonts: font is {} but hAnsi='{}'; ignoring hAnsi.".format(font, hAnsiFont))
+
+        font = font_families.get(font, font)
+        if font is not None:
+            put('font-family', font)
+
+@pr_handler('vertAlign')
+def pr_vertical_align(e, k, put):
+    if len(k.attrib) == 1 and k_val in k.attrib:
+        v = k.get(k_val)
+        if v == 'superscript':
+            put('vertical-align', 'super')
+        elif v == 'subscript':
+            put('vertical-align', 'sub')
+
+@pr_handler('shd')
+def pr_shading(e, k, put):
+    val = k.get(k_val)
+    if val == 'solid':
+        color = parse_color(k.get(k_color))
+    elif val == 'clear':
+        color = parse_color(k.get(k_fill))
+    else:
+        color = None
+
+    if color is not None:
+        put('background-color', color)
+
+@pr_handler('tcBorders', 'tblBorders')
+def pr_borders(e, k, put):
+    # tblBorders can have insideH/insideV elements that are applied to
+    # all horizontal/vertical borders between cells in the table. For
+    # now, we store that style information in CSS properties named
+    # -ooxml-border-insideH/insideV; later we will turn that into
+    # border-top/left properties on all the individual table cells.
+    for side_tag, prop in border_sides:
+        for side_style in k.findall(side_tag):
+            if side_style.get(k_val) == 'single':
+                color = parse_color(side_style.get(k_color)) or 'black'
+                sz = side_style.get(k_sz)
+                if sz is not None:
+                    sz = int(sz) // 6
+                put(prop, '{}px solid {}'.format(sz, color))
+
+@pr_handler('sz')
+def pr_size(e, k, put):
+    if len(k.attrib) == 1 and k_val in k.attrib:
+        # The unit of w:sz is half-points lol.
+        v = float(k.get(k_val)) / 2
+        #put('font-size', str(v) + 'pt')
+
+_twips_to_pt = {}
+
+def twips_to_pt(s, is_flipped=False):
+    # Documents use the same few indents over and over, so cache the results.
+    key = s, is_flipped
+    try:
+        return _twips_to_pt[key]
+    except KeyError:
+        pass
+
+    val = round(int(s), -1)  # round to nearest ten (nearest half point)
+    assert val >= 0
+    if is_flipped:
+        val = -val
+    pt = _twips_to_pt[key] = f'{val / 20}pt'
+    return pt
+
+@pr_handler('ind')
+def pr_indentation(e, k, put):
+    val = k.get(k_left)
+    if val is not None:
+        put('margin-left', twips_to_pt(val))
+    val = k.get(k_firstLine)
+    if val is not None:
+        put('text-indent', twips_to_pt(val))
+    val = k.get(k_hanging)
+    if val is not None:
+        put('text-indent', twips_to_pt(val, True))
+
+@pr_handler('numPr')
+def pr_numbering(e, k, put):
+    for item in k:
+        item_tag = shorten(item.tag)
+        if item_tag == 'ilvl':
+            assert len(item.attrib) == 1 and k_val in item.attrib
+            put('-ooxml-ilvl', item.get(k_val))
+        elif item_tag == 'numId':
+            assert len(item.attrib) == 1 and k_val in item.attrib
+            put('-ooxml-numId', item.get(k_val))
+
+@pr_handler('pStyle', 'rStyle')
+def pr_style_class(e, k, put):
+    if len(k.attrib) == 1 and k_val in k.attrib:
+        # Intern style names. The same few dozen appear on nearly every
+        # paragraph and run, and they end up as keys of the styles dict.
+        put('@cls', sys.intern(k.get(k_val)))
+
+@pr_handler('rPr')
+def pr_run_properties(e, k, put):
+    if e.tag == k_pPr:
+        # This rPr actually applies to the pilcrow symbol that Word can
+        # (optionally) display at the end of the paragraph. The only
+        # possibly interesting thing here is if the pilcrow is deleted,
+        # indicating this paragraph has been joined with the next one.
+        if any(j.tag == k_del for j in k):
+            put('-ooxml-deleted', '1')
+    else:
+        for prop, v in parse_pr(k).items():
+            # TODO - support these properly
+            if prop == 'background-color' or prop == '@cls':
+                continue
+            put(prop, v)
 
+def parse_pr(e):
     assert e.text is None
 
     pr = {}
     def put(k, v):
-        if k in pr and pr[k] != v:
+        prev = pr.setdefault(k, v)
+        if prev is not v and prev != v:
             raise Exception("duplicate CSS property on the same element: " + k)
-        pr[k] = v
 
     for k in e:
         assert k.tail is None
-        name = shorten(k.tag)
-
-        # TODO: caps, smallCaps, vanish, u, sz
-
-        if name == 'i':
-            if not k.keys():
-                put('font-style', 'italic')
-
-        elif name == 'b':
-            if not k.keys():
-                put('font-weight', 'bold')
-
-        elif name == 'rFonts':
-            # ascii, hAnsi, cs, and eastAsia are four different fixed subsets
-            # of the Unicode character set. A single w:rFonts element can
-            # contain all four, and the corresponding run of text is rendered
-            # using one of four fonts, for each character, depending on which
-            # subset that character falls into.
-            #
-            # We don't implement any of that, because for any given w:rFonts
-            # element, it seems the same font is specified for all the
-            # attributes that are actually defined. (There is only one
-            # exception in the document; we ignore it.)
-            #
-            # It's unclear what is supposed to happen when one or more of the
-            # four attributes is missing.
-            #
-            # In addition there are four more possible attributes: asciiTheme,
-            # hAnsiTheme, cstheme, eastAsiaTheme.  Handling these correctly
-            # apparently requires you to parse a whole extra file, theme1.xml.
-
-            # These are the fonts mentioned in rFonts elements in the Language
-            # Specification, including both document.xml and styles.xml:
-            #   Arial, Arial Unicode MS, ArialMT, CG Times, Century,
-            #   Courier New, Garamond, Geneva, Helvetica, MS Gothic,
-            #   Mistral, Symbol, Tahoma, Times, Times New Roman, Tms Rmn,
-            #   Verdana, Wingdings
-
-            assert set(k.keys()) <= font_keys
-            font = k.get(k_ascii) or k.get(k_cs)
-            if font is not None:
-                assert k.get(k_ascii, font) == font
-                hAnsiFont = k.get(k_hAnsi, font)
-                if hAnsiFont != font:
-                    warn("rFonts: font is {} but hAnsi='{}'; ignoring hAnsi.".format(font, hAnsiFont))
-
-                if font == 'Symbol':
-                    font = None  # appears once in the document, superfluous
-                elif font == 'Mistral':
-                    font = None  # fanciful, drop it
-                elif font == 'Courier New':
-                    font = 'monospace'
-                elif font in ('Arial', 'ArialMT', 'Arial Unicode MS', 'Helvetica'):
-                    font = 'sans-serif'
-                elif font in ('CG Times', 'Times', 'Tms Rmn'):
-                    font = 'Times New Roman'
-
-                if font is not None:
-                    put('font-family', font)
-
-        elif name == 'vertAlign':
-            if list(k.keys()) == [k_val]:
-                v = k.get(k_val)
-                if v == 'superscript':
-                    put('vertical-align', 'super')
-                elif v == 'subscript':
-                    put('vertical-align', 'sub')
-
-        elif name == 'shd':
-            val = k.get(k_val)
-            if val == 'solid':
-                color = parse_color(k.get(k_color))
-            elif val == 'clear':
-                color = parse_color(k.get(k_fill))
-            else:
-                color = None
-
-            if color is not None:
-                put('background-color', color)
-
-        elif name in ('tcBorders', 'tblBorders'):
-            # tblBorders can have insideH/insideV elements that are applied to
-            # all horizontal/vertical borders between cells in the table. For
-            # now, we store that style information in CSS properties named
-            # -ooxml-border-insideH/insideV; later we will turn that into
-            # border-top/left properties on all the individual table cells.
-            for side in ('top', 'bottom', 'left', 'right', 'insideH', 'insideV'):
-                for side_style in k.findall(bloat(side)):
-                    if side_style.get(k_val) == 'single':
-                        color = parse_color(side_style.get(k_color)) or 'black'
-                        sz = side_style.get(k_sz)
-                        if sz is not None:
-                            sz = int(sz) // 6
-                        prop = 'border-' + side
-                        if side.startswith('inside'):
-                            prop = '@' + prop
-                        put('border-' + side, '{}px solid {}'.format(sz, color))
-
-        elif name == 'sz':
-            if list(k.keys()) == [k_val]:
-                # The unit of w:sz is half-points lol.
-                v = float(k.get(k_val)) / 2
-                #put('font-size', str(v) + 'pt')
-
-        # todo: jc, spacing, contextualSpacing
-        # todo: pBdr
-
-        elif name == 'ind':
-            def fetch(key, css_prop, is_flipped=False):
-                val = k.get(key)
-                if val is not None:
-                    val = round(int(val), -1)  # round to nearest ten (nearest half point)
-                    assert val >= 0
-                    if is_flipped:
-                        val = -val
-                    put(css_prop, str(val / 20) + 'pt')
-
-            fetch(k_left, 'margin-left')
-            fetch(k_firstLine, 'text-indent')
-            fetch(k_hanging, 'text-indent', is_flipped=True)
-
-        elif name == 'numPr':
-            for item in k:
-                item_tag = shorten(item.tag)
-                if item_tag == 'ilvl':
-                    assert list(item.keys()) == [k_val]
-                    put('-ooxml-ilvl', item.get(k_val))
-                elif item_tag == 'numId':
-                    assert list(item.keys()) == [k_val]
-                    put('-ooxml-numId', item.get(k_val))
-
-        elif name in ('pStyle', 'rStyle'):
-            if list(k.keys()) == [k_val]:
-                put('@cls', k.get(k_val))
-
-        elif name == 'rPr':
-            if shorten(e.tag) == 'pPr':
-                # This rPr actually applies to the pilcrow symbol that Word can
-                # (optionally) display at the end of the paragraph. The only
-                # possibly interesting thing here is if the pilcrow is deleted,
-                # indicating this paragraph has been joined with the next one.
-                if any(shorten(j.tag) == 'del' for j in k):
-                    put('-ooxml-deleted', '1')
-            else:
-                for k, v in parse_pr(k).items():
-                    # TODO - support these properly
-                    if k == 'background-color' or k == '@cls':
-                        continue
-                    put(k, v)
+        handler = pr_handlers.get(k.tag)
+        if handler is not None:
+            handler(e, k, put)
 
     return pr
 
 k_style = bloat('style')
 k_styleId = bloat('styleId')
 
+def iter_children(stream, *path):
+    """ Incrementally parse the XML in `stream`, yielding each child of the
+    element at `path` (the tags of the root element and of its descendants
+    down to the parent we want) as soon as it is complete. Each child is
+    cleared and dropped once the caller is done with it, so the whole tree
+    is never in memory at once. Elements off the path, like a w:background
+    before w:body, are cleared and dropped without being yielded.
+    """
+    depth = 0
+    ancestors = []  # the elements matched so far along path
+    for event, e in ElementTree.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            if depth == len(ancestors) < len(path) and e.tag == path[depth]:
+                ancestors.append(e)
+            depth += 1
+        else:
+            depth -= 1
+            if depth < len(ancestors):
+                # The end of an element on the path.
+                del ancestors[depth:]
+            elif depth == len(ancestors):
+                # A child of the deepest element matched so far.
+                if depth == len(path):
+                    yield e
+                e.clear()
+                if ancestors:
+                    ancestors[-1].remove(e)
+
 class Style:
+    __slots__ = ('id', 'basedOn', 'style', 'full_style', 'type')
+
     def __init__(self, id, basedOn, type):
         self.id = id
         self.basedOn = basedOn
@@ -243,42 +337,67 @@ k_rPr = bloat('rPr')
 
 def parse_style(e):
     assert e.tag == k_style
-    basedOn_elt = e.find(k_basedOn)
-    if basedOn_elt is None:
-        basedOn = None
-    else:
+
+    # Find the children we care about in a single pass.
+    basedOn_elt = pPr = rPr = None
+    for kid in e:
+        tag = kid.tag
+        if tag == k_basedOn:
+            assert basedOn_elt is None
+            basedOn_elt = kid
+        elif tag == k_pPr:
+            assert pPr is None
+            pPr = kid
+        elif tag == k_rPr:
+            assert rPr is None
+            rPr = kid
+
+    basedOn = None
+    if basedOn_elt is not None:
         basedOn = basedOn_elt.get(k_val)
-    s = Style(e.get(k_styleId), basedOn, type=e.get(k_type))
+        if basedOn is not None:
+            basedOn = sys.intern(basedOn)
+    sid = e.get(k_styleId)
+    if sid is not None:
+        sid = sys.intern(sid)
+    s = Style(sid, basedOn, type=e.get(k_type))
 
-    pPr = e.find(k_pPr)
     if pPr is not None:
         s.style.update(parse_pr(pPr))
-    rPr = e.find(k_rPr)
     if rPr is not None:
         s.style.update(parse_pr(rPr))
     return s
 
-def parse_styles(e):
-    assert e.tag == bloat('styles')
-
+def parse_styles(stream):
     all_styles = {}
-    for k in e.findall(k_style):
-        s = parse_style(k)
-        assert s.id not in all_styles
-        all_styles[s.id] = s
-
-    def populate_full_style(s):
-        if s.full_style is None:
-            if s.basedOn is None:
-                s.full_style = s.style
-            else:
-                parent = all_styles[s.basedOn]
-                populate_full_style(parent)
-                s.full_style = parent.full_style.copy()
-                s.full_style.update(s.style)
-
+    for k in iter_children(stream, k_styles):
+        if k.tag == k_style:
+            s = parse_style(k)
+            assert s.id not in all_styles
+            all_styles[s.id] = s
+
+    # Find the depth of each style in the w:basedOn tree.
+    depth = {}
     for s in all_styles.values():
-        populate_full_style(s)
+        chain = []
+        while s.id not in depth:
+            if s.basedOn is None:
+                depth[s.id] = 0
+                break
+            assert s not in chain, "w:basedOn cycle at style " + s.id
+            chain.append(s)
+            s = all_styles[s.basedOn]
+        d = depth[s.id]
+        for s in reversed(chain):
+            d += 1
+            depth[s.id] = d
+
+    # Compute full styles, parents before children.
+    for s in sorted(all_styles.values(), key=lambda s: depth[s.id]):
+        if s.basedOn is None:
+            s.full_style = s.style
+        else:
+            s.full_style = {**all_styles[s.basedOn].full_style, **s.style}
 
     return all_styles
 
@@ -294,15 +413,24 @@ k_numStyleLink = bloat('numStyleLink')
 k_numbering = bloat('numbering')
 k_pStyle = bloat('pStyle')
 k_startOverride = bloat('startOverride')
+k_start = bloat('start')
+k_styleLink = bloat('styleLink')
+k_styles = bloat('styles')
+k_suff = bloat('suff')
+k_lvlText = bloat('lvlText')
 k_sz = bloat('sz')
 
 class Num:
+    __slots__ = ('abstract_num_id', 'overrides', 'computed_levels')
+
     def __init__(self, abstract_num_id, overrides):
         self.abstract_num_id = abstract_num_id
         self.overrides = overrides
         self.computed_levels = None
 
 class AbstractNum:
+    __slots__ = ('levels', 'num_style_link', 'computed_levels')
+
     def __init__(self, levels, num_style_link):
         assert levels is None or num_style_link is None
         self.levels = levels
@@ -317,20 +445,34 @@ class Lvl:
     self.numFmt is str.
     self.lvlText is str.
     self.suff is str.
-    self.style and self.full_style are CSS dictionaries.
+    self.full_style is a CSS dictionary.
     """
+    __slots__ = ('start', 'pStyle', 'numFmt', 'lvlText', 'suff', 'full_style')
+
+    def __init__(self):
+        self.start = None
+        self.pStyle = None
+        self.numFmt = None
+        self.lvlText = None
+        self.suff = None
+        self.full_style = None
+
     def with_start(self, start):
-        clone = copy.copy(self)
+        clone = Lvl()
         clone.start = start
+        clone.pStyle = self.pStyle
+        clone.numFmt = self.numFmt
+        clone.lvlText = self.lvlText
+        clone.suff = self.suff
+        clone.full_style = self.full_style
         return clone
 
 def get_val(e, key, default_value = None):
-    kids = list(e.findall(bloat(key)))
-    if kids:
-        [kid] = kids
-        return kid.get(k_val, default_value)
-    else:
+    """ Return the w:val attribute of e's child element `key` (a k_ constant). """
+    kid = e.find(key)
+    if kid is None:
         return default_value
+    return kid.get(k_val, default_value)
 
 suff_values = {
     'nothing': '',
@@ -338,28 +480,53 @@ suff_values = {
     'tab': '\t'
 }
 
+lvl_val_tags = frozenset([k_start, k_numFmt, k_pStyle, k_lvlText, k_suff])
+
 def parse_lvl(docx, e):
     lvl = Lvl()
     assert e.tag == k_lvl
-    lvl.start = int(get_val(e, 'start', '1'))
-    lvl.numFmt = get_val(e, 'numFmt')
-    lvl.pStyle = get_val(e, 'pStyle')
-    lvl.lvlText = get_val(e, 'lvlText')
-    lvl.suff = suff_values[get_val(e, 'suff', 'tab')]
+
+    # Sort the children out in a single pass.
+    val_kids = {}
+    pPr_kids = []
+    rPr_kids = []
+    for kid in e:
+        tag = kid.tag
+        if tag == k_pPr:
+            pPr_kids.append(kid)
+        elif tag == k_rPr:
+            rPr_kids.append(kid)
+        elif tag in lvl_val_tags:
+            assert tag not in val_kids
+            val_kids[tag] = kid
+
+    def val(key, default_value=None):
+        kid = val_kids.get(key)
+        if kid is None:
+            return default_value
+        return kid.get(k_val, default_value)
+
+    lvl.start = int(val(k_start, '1'))
+    lvl.numFmt = val(k_numFmt)
+    lvl.pStyle = val(k_pStyle)
+    lvl.lvlText = val(k_lvlText)
+    lvl.suff = suff_values[val(k_suff, 'tab')]
 
     if lvl.pStyle is None:
         style = {}
     else:
         style = docx.styles[lvl.pStyle].full_style.copy()
-    for kid in e.findall(k_pPr):
+    for kid in pPr_kids:
         style.update(parse_pr(kid))
-    for kid in e.findall(k_rPr):
+    for kid in rPr_kids:
         style.update(parse_pr(kid))
     lvl.full_style = style
 
     return lvl
 
 class LvlOverride:
+    __slots__ = ('ilvl', 'lvl', 'startOverride')
+
     def __init__(self, ilvl, lvl, startOverride):
         self.ilvl = ilvl
         self.lvl = lvl
@@ -371,15 +538,13 @@ def parse_lvlOverride(docx, e):
     lvl = None
     startOverride = None
 
-    all_lvl = e.findall(k_lvl)
-    if all_lvl:
-        [sole_lvl] = all_lvl
-        lvl = parse_lvl(docx, sole_lvl)
-
-    all_startOverride = e.findall(k_startOverride)
-    if all_startOverride:
-        [sole_startOverride] = all_startOverride
-        startOverride = int(sole_startOverride.get(k_val))
+    for kid in e:
+        if kid.tag == k_lvl:
+            assert lvl is None
+            lvl = parse_lvl(docx, kid)
+        elif kid.tag == k_startOverride:
+            assert startOverride is None
+            startOverride = parse_startOverride(kid)
 
     if len(e) == 0:
         startOverride = 0  # land of absurd defaults
@@ -398,7 +563,11 @@ class Numbering:
     self.abstract_num is {abstract_num_id: AbstractNum object}.
     self.num is {num_id: Num object}.
     self.style_links is {styleLink value: abstract_num_id}.
+    self.levels is {(num_id, ilvl): Lvl object or None}, with every
+    indirection and override already resolved.
     """
+    __slots__ = ('abstract_num', 'num', 'style_links', 'levels')
+
     def __init__(self, abstract_num, num, style_links):
         self.abstract_num = abstract_num
         self.num = num
@@ -420,6 +589,11 @@ class Numbering:
                         levels[i] = levels[i].with_start(lvlOverride.startOverride)
             num.computed_levels = levels
 
+        # Index every level, so looking one up is a single dict hit.
+        self.levels = {(num_id, ilvl): level
+                       for num_id, num in self.num.items()
+                       for ilvl, level in enumerate(num.computed_levels)}
+
     def _compute_abstract_num_levels(self, abstract_num_id):
         abstract_num = self.abstract_num[abstract_num_id]
         if abstract_num.computed_levels is not None:
@@ -444,112 +618,166 @@ class Numbering:
         num = self.num[numId]
         return num.abstract_num_id, num.computed_levels
 
-def parse_numbering(docx, e):
+def parse_numbering(docx, stream):
     # See <http://msdn.microsoft.com/en-us/library/ee922775%28office.14%29.aspx>.
-    assert e.tag == k_numbering
 
     # eat crunchy xml, num num num
     abstract_num = {}
     style_links = {}
-    for ane in e.findall(k_abstractNum):
-        abstract_id = int(ane.get(k_abstractNumId))
-
-        # w:numStyleLink. This is a reference to a w:abstractNum that has a
-        # w:styleLink child element.
-        nsl = list(ane.findall(k_numStyleLink))
-        if len(nsl) == 0:
-            levels = []
-            for level in ane.findall(k_lvl):
-                ilvl = int(level.get(k_ilvl))
-                while len(levels) <= ilvl:
-                    levels.append(None)
-                levels[ilvl] = parse_lvl(docx, level)
-            abstract_num[abstract_id] = AbstractNum(levels, None)
-        else:
-            assert len(nsl) == 1
-            assert len(list(ane.findall(k_lvl))) == 0
-            abstract_num[abstract_id] = AbstractNum(None, nsl[0].get(k_val))
-
-        # w:styleLink.
-        link = get_val(ane, 'styleLink')
-        if link is not None:
-            assert link not in style_links
-            style_links[link] = abstract_id
-
-    # Build the num dictionary (extra level of misdirection in OOXML, awesome)
     num = {}
-    for style in e.findall(k_num):
-        numId = int(style.get(k_numId))
-        val = int(get_val(style, 'abstractNumId'))
-        overrides = []
-        for override_element in style.findall(k_lvlOverride):
-            lvlOverride = parse_lvlOverride(docx, override_element)
-            while len(overrides) <= lvlOverride.ilvl:
-                overrides.append(None)
-            overrides[lvlOverride.ilvl] = lvlOverride
-        num[numId] = Num(val, overrides)
+    for kid in iter_children(stream, k_numbering):
+        if kid.tag == k_abstractNum:
+            ane = kid
+            abstract_id = int(ane.get(k_abstractNumId))
+
+            # Sort the children out in a single pass.
+            lvl_kids = []
+            nsl = []
+            style_link_kids = []
+            for k in ane:
+                if k.tag == k_lvl:
+                    lvl_kids.append(k)
+                elif k.tag == k_numStyleLink:
+                    nsl.append(k)
+                elif k.tag == k_styleLink:
+                    style_link_kids.append(k)
+
+            # w:numStyleLink. This is a reference to a w:abstractNum that has a
+            # w:styleLink child element.
+            if len(nsl) == 0:
+                levels = []
+                for level in lvl_kids:
+                    ilvl = int(level.get(k_ilvl))
+                    if len(levels) <= ilvl:
+                        levels.extend([None] * (ilvl + 1 - len(levels)))
+                    levels[ilvl] = parse_lvl(docx, level)
+                abstract_num[abstract_id] = AbstractNum(levels, None)
+            else:
+                assert len(nsl) == 1
+                assert len(lvl_kids) == 0
+                abstract_num[abstract_id] = AbstractNum(None, nsl[0].get(k_val))
+
+            # w:styleLink.
+            assert len(style_link_kids) <= 1
+            link = style_link_kids[0].get(k_val) if style_link_kids else None
+            if link is not None:
+                assert link not in style_links
+                style_links[link] = abstract_id
+
+        elif kid.tag == k_num:
+            # Build the num dictionary (extra level of misdirection in OOXML, awesome)
+            style = kid
+            numId = int(style.get(k_numId))
+            val = int(get_val(style, k_abstractNumId))
+            parsed = [parse_lvlOverride(docx, override_element)
+                      for override_element in style.findall(k_lvlOverride)]
+            overrides = [None] * (max((o.ilvl for o in parsed), default=-1) + 1)
+            for lvlOverride in parsed:
+                overrides[lvlOverride.ilvl] = lvlOverride
+            num[numId] = Num(val, overrides)
 
     return Numbering(abstract_num, num, style_links)
 
+k_document = bloat('document')
+k_body = bloat('body')
+
 class Document:
+    @property
+    def document(self):
+        """ The whole document.xml tree, parsed on first use. transform()
+        doesn't need this; it streams the body with iter_body() instead. """
+        if self._document is None:
+            with zipfile.ZipFile(self.filename) as f:
+                self._document = parse_part(f, 'word/document.xml')
+        return self._document
+
+    def iter_body(self):
+        """ Incrementally parse document.xml, yielding each child of w:body
+        (mostly w:p and w:tbl elements) as soon as it is complete. """
+        with zipfile.ZipFile(self.filename) as f:
+            with f.open('word/document.xml') as stream:
+                yield from iter_children(stream, k_document, k_body)
+
     def _extract(self):
-        def writexml(e, out, indent='', context='block'):
-            t = shorten(e.tag)
-            assert e.tail is None
-            start_tag = t
-            for k, v in e.items():
-                start_tag += ' {0}="{1}"'.format(shorten(k), escape(v, True))
-
-            kids = list(e)
-            if kids:
-                assert e.text is None
-                out.write("{0}<{1}>\n".format(indent, start_tag))
-                for k in kids:
-                    writexml(k, out, indent + '  ')
-                out.write("{0}</{1}>\n".format(indent, t))
-            elif e.text:
-                out.write("{0}<{1}>{2}</{3}>\n".format(indent, start_tag, escape(e.text), t))
-            else:
-                out.write("{0}<{1} />\n".format(indent, start_tag))
+        def writexml(root, parts, shorten=shorten, escape=escape):
+            # Walk the tree with an explicit stack rather than recursion.
+            # Each entry is (element, indent), or (end tag, None) for an
+            # element whose children have all been written.
+            stack = [(root, '')]
+            pop = stack.pop
+            push = stack.append
+            append = parts.append
+            while stack:
+                e, indent = pop()
+                if indent is None:
+                    append(e)
+                    continue
+
+                t = shorten(e.tag)
+                assert e.tail is None
+                start_tag = t
+                for k, v in e.items():
+                    start_tag += f' {shorten(k)}="{escape(v, True)}"'
+
+                if len(e):
+                    assert e.text is None
+                    append(f"{indent}<{start_tag}>\n")
+                    push((f"{indent}</{t}>\n", None))
+                    kid_indent = indent + '  '
+                    stack.extend([(k, kid_indent) for k in reversed(e)])
+                elif e.text:
+                    append(f"{indent}<{start_tag}>{escape(e.text)}</{t}>\n")
+                else:
+                    append(f"{indent}<{start_tag} />\n")
 
         def save(tree, filename):
+            parts = []
+            writexml(tree, parts)
             with open(filename, 'w', encoding='utf-8') as out:
-                writexml(tree, out)
+                out.writelines(parts)
 
         save(self.document, 'original.xml')
-        save(self.styles_raw, 'styles.xml')
-        save(self.numbering_raw, 'numbering.xml')
+
+        # styles.xml and numbering.xml were streamed through by load(), not
+        # kept, so read them again.
+        with zipfile.ZipFile(self.filename) as f:
+            save(parse_part(f, 'word/styles.xml'), 'styles.xml')
+            save(parse_part(f, 'word/numbering.xml'), 'numbering.xml')
 
     def _dump_styles(self):
         for cls, s in sorted(self.styles.items()):
             tagname = 'p'
             if s.type == 'character':
                 tagname = 'span'
-            print(tagname + "." + cls + " {")
-            for prop, value in s.style.items():
-                print("    " + prop + ": " + value + ";")
+            lines = [f"{tagname}.{cls} {{\n"]
+            lines += [f"    {prop}: {value};\n" for prop, value in s.style.items()]
             if s.basedOn is not None:
                 parent = self.styles[s.basedOn]
-                for prop, value in parent.full_style.items():
-                    if prop not in s.style:
-                        print("    " + prop + ": " + value + ";  /* inherited */")
-            print("}\n")
+                lines += [f"    {prop}: {value};  /* inherited */\n"
+                          for prop, value in parent.full_style.items()
+                          if prop not in s.style]
+            lines.append("}\n")
+            print(''.join(lines))
 
     def get_list_style_at_level(self, numId, ilvl):
         """ Returns a Lvl object; its .full_style attribute is a CSS dictionary. """
-        return self.numbering.num[numId].computed_levels[int(ilvl)]
+        return self.numbering.levels[numId, int(ilvl)]
 
-def load(filename):
-    with zipfile.ZipFile(filename) as f:
-        document_xml = f.read('word/document.xml')
-        styles_xml = f.read('word/styles.xml')
-        numbering_xml = f.read('word/numbering.xml')
+def parse_part(f, name):
+    # Parse straight from the zip stream, so the decompressed bytes are
+    # never held in memory all at once.
+    with f.open(name) as stream:
+        return ElementTree.parse(stream).getroot()
 
+def load(filename):
     doc = Document()
     doc.filename = filename
-    doc.document = ElementTree.fromstring(document_xml)
-    doc.styles_raw = ElementTree.fromstring(styles_xml)
-    doc.styles = parse_styles(doc.styles_raw)
-    doc.numbering_raw = ElementTree.fromstring(numbering_xml)
-    doc.numbering = parse_numbering(doc, doc.numbering_raw)
+    doc.basename = os.path.basename(filename)
+    doc.basename_lower = doc.basename.lower()
+    doc._document = None
+    with zipfile.ZipFile(filename) as f:
+        with f.open('word/styles.xml') as stream:
+            doc.styles = parse_styles(stream)
+        with f.open('word/numbering.xml') as stream:
+            doc.numbering = parse_numbering(doc, stream)
     return doc
@@ -9,52 +9,79 @@ The entry point is fixup().
 
 import htmodel as html
 from warnings import warn
-import collections, contextlib, os, time, re, json
+import collections, contextlib, functools, os, time, re, json
 from hacks import declare_hack, using_hack, warn_about_unused_hacks
 
 
 # === Useful functions
 
+# These walk the tree with an explicit stack rather than recursive
+# generators, which would resume a chain of generator frames for every node.
+# Each element's content list is iterated live, as a for loop would, so
+# callers may replace parent.content[i] while iterating.
+
 def findall(e, name):
     if e.name == name:
         yield e
-    for k in e.content:
-        if not isinstance(k, str):
-            for d in findall(k, name):
-                yield d
+    stack = [iter(e.content)]
+    while stack:
+        for k in stack[-1]:
+            if not isinstance(k, str):
+                if k.name == name:
+                    yield k
+                stack.append(iter(k.content))
+                break
+        else:
+            stack.pop()
 
 def all_parent_index_child_triples(e):
-    for i, k in enumerate(e.content):
-        if not isinstance(k, str):
-            yield e, i, k
-            for t in all_parent_index_child_triples(k):
-                yield t
+    stack = [(e, enumerate(e.content))]
+    while stack:
+        parent, kids = stack[-1]
+        for i, k in kids:
+            if not isinstance(k, str):
+                yield parent, i, k
+                stack.append((k, enumerate(k.content)))
+                break
+        else:
+            stack.pop()
 
 def all_parent_index_child_triples_reversed(e):
-    i = len(e.content) - 1
-    while i >= 0:
-        k = e.content[i]
-        if not isinstance(k, str):
-            for t in all_parent_index_child_triples_reversed(k):
-                yield t
-            assert e.content[i] is k
-            yield e, i, k
-        i -= 1
+    # Children are visited last to first, and each triple is yielded after
+    # the child's own subtree. Stack entries are either (parent, i), meaning
+    # parent.content[i] and everything before it remain to be visited, or
+    # (parent, i, k), meaning k's subtree is done and the triple is next.
+    stack = [(e, len(e.content) - 1)]
+    while stack:
+        entry = stack.pop()
+        if len(entry) == 3:
+            parent, i, k = entry
+            assert parent.content[i] is k
+            yield entry
+            continue
+
+        parent, i = entry
+        if i >= 0:
+            stack.append((parent, i - 1))
+            k = parent.content[i]
+            if not isinstance(k, str):
+                stack.append(entry + (k,))
+                stack.append((k, len(k.content) - 1))
 
 def spec_is_intl(docx):
-    return os.path.basename(docx.filename).lower().startswith('es-intl')
+    return docx.basename_lower.startswith('es-intl')
 
 def spec_is_lang(docx):
-    return not os.path.basename(docx.filename).lower().startswith('es-intl')
+    return not docx.basename_lower.startswith('es-intl')
 
 def version_is_5(docx):
-    return os.path.basename(docx.filename).lower().startswith('es5')
+    return docx.basename_lower.startswith('es5')
 
 def version_is_51_final(docx):
-    return os.path.basename(docx.filename) == 'es5.1-final.dotx'
+    return docx.basename == 'es5.1-final.dotx'
 
 def version_is_intl_1_final(docx):
-    return os.path.basename(docx.filename) == 'es-intl-1-final.docx'
+    return docx.basename == 'es-intl-1-final.docx'
 
 
 # === Kinds of fixups
@@ -85,13 +112,28 @@ class InPlaceFixup:
 
 # === Fixups
 
-@Fixup
+@InPlaceFixup
 def fixup_strip_empty_paragraphs(doc, docx):
     """ Empty paragraphs are meaningless in HTML. Drop them. """
-    def is_empty_para(e):
-        return e.name == 'p' and len(e.content) == 0
-    return doc.find_replace(is_empty_para, lambda e: [])
-
+    def is_empty_para(ht):
+        return not isinstance(ht, str) and ht.name == 'p' and len(ht.content) == 0
+
+    # Each element's content is filtered before its children are visited, so
+    # (as with find_replace) a paragraph that only held empty paragraphs is
+    # kept.
+    stack = [doc]
+    while stack:
+        e = stack.pop()
+        found = False
+        for k in e.content:
+            if is_empty_para(k):
+                found = True
+            elif not isinstance(k, str):
+                stack.append(k)
+        if found:
+            e.content = [k for k in e.content if not is_empty_para(k)]
+
+@functools.lru_cache(maxsize=None)
 def int_to_lower_roman(i):
     """ Convert an integer to Roman numerals.
     From Paul Winkler's recipe: https://code.activestate.com/recipes/81611-roman-numerals/
@@ -125,14 +167,28 @@ list_formatters = {
     'upperRoman': lambda i: int_to_lower_roman(i).upper()
 }
 
+lvl_text_placeholder_re = re.compile(r'%([1-9])')
+
+@functools.lru_cache(maxsize=None)
+def split_lvl_text(lvl_text):
+    """ Split a w:lvlText template like '%1.%2.' into a tuple of literal strings
+    (at even indices) and 0-based level indexes (at odd indices). """
+    parts = lvl_text_placeholder_re.split(lvl_text)
+    for i in range(1, len(parts), 2):
+        parts[i] = int(parts[i]) - 1
+    return tuple(parts)
+
 def render_list_marker(levels, numbers):
-    def repl(m):
-        ilvl = int(m.group(1)) - 1
-        level = levels[ilvl]
-        return list_formatters[level.numFmt](numbers[ilvl])  # should ignore numFmt if isLgl
     this_level = levels[len(numbers) - 1]
-    text = re.sub(r'%([1-9])', repl, this_level.lvlText)
-    return text + this_level.suff
+    parts = split_lvl_text(this_level.lvlText)
+    out = [parts[0]]
+    for i in range(1, len(parts), 2):
+        ilvl = parts[i]
+        level = levels[ilvl]
+        out.append(list_formatters[level.numFmt](numbers[ilvl]))  # should ignore numFmt if isLgl
+        out.append(parts[i + 1])
+    out.append(this_level.suff)
+    return ''.join(out)
 
 @Fixup
 def fixup_add_numbering(doc, docx):
@@ -144,50 +200,49 @@ def fixup_add_numbering(doc, docx):
     numbering_context = collections.defaultdict(list)
     seen_numids = set()
 
+    def numbering_style(style):
+        """ The full style of the list level that the given CSS dictionary
+        puts a paragraph in, or None if it doesn't specify numbering. """
+        if style is None:
+            return None
+        _numid = int(style.get('-ooxml-numId', '0'))
+        if _numid == 0:
+            return None
+        _ilvl = int(style.get('-ooxml-ilvl', '0'))
+        lvl = docx.get_list_style_at_level(_numid, _ilvl)
+        return None if lvl is None else lvl.full_style
+
     def add_numbering(p):
         cls = p.attrs and p.attrs.get('class')
-        paragraph_style = docx.styles[cls]
+        paragraph_style = docx.styles[cls].full_style
 
         numid = ilvl = None
+
+        # The places a property can come from, highest precedence first:
+        # this paragraph's own properties; then, if pPr>numPr>numId is
+        # present on the paragraph, properties inherited from the
+        # corresponding w:lvl>w:pPr; then the paragraph style (full_style
+        # incorporates properties inherited via the w:basedOn chain); and
+        # lastly properties inherited from numbering based on the paragraph
+        # style. The numbering properties themselves can't come from
+        # numbering.
+        numbering_chain = [s for s in (p.style, paragraph_style) if s]
+        style_chain = [s for s in (p.style, numbering_style(p.style),
+                                   paragraph_style, numbering_style(paragraph_style))
+                       if s]
+
         def computed_style(name, default_value):
             """
             Get computed style for the given property name.
             Returns a string, or default_value if no such property is defined anywhere.
             """
-
-            # This paragraph's properties override everything else.
-            if p.style and name in p.style:
-                return p.style[name]
-
-            # If pPr>numPr>numId is present on the paragraph, then
-            # properties inherited from the corresponding w:lvl>w:pPr are
-            # next-highest in precedence.
-            def fetch_from_numbering(style):
-                if style is None or name in ('-ooxml-numId', '-ooxml-ilvl'):
-                    return None
-                _numid = int(style.get('-ooxml-numId', '0'))
-                if _numid == 0:
-                    return None
-                _ilvl = int(style.get('-ooxml-ilvl', '0'))
-                lvl = docx.get_list_style_at_level(_numid, _ilvl)
-                if lvl is not None and name in lvl.full_style:
-                    return lvl.full_style[name]
-
-            val = fetch_from_numbering(p.style)
-            if val is not None:
-                return val
-
-            # After that come the properties defined in paragraph
-            # style. Note that full_style incorporates properties that are
-            # inherited via the w:basedOn chain.
-            if name in paragraph_style.full_style:
-                return paragraph_style.full_style[name]
-
-            # Lastly, properties inherted from numbering based on the paragraph
-            # style.
-            val = fetch_from_numbering(paragraph_style.full_style)
-            if val is not None:
-                return val
+            if name in ('-ooxml-numId', '-ooxml-ilvl'):
+                chain = numbering_chain
+            else:
+                chain = style_chain
+            for style in chain:
+                if name in style:
+                    return style[name]
 
             # Not specified anywhere.
             return default_value
@@ -310,6 +365,28 @@ def map_body(doc, f):
     head, body = doc.content
     return doc.with_content([head, f(body)])
 
+algorithm_arguments_re = re.compile(r'''(?x)
+    ^
+    # Ignore optional section number.
+    (?: \d+ (?: \. \d+ )* \s* )?
+    # Ignore optional "Runtime Semantics:" label
+    (?: (?:Runtime|Static) \s* Semantics \s* : \s* )?
+    # Actual algorithm name
+    (?:
+        (?: new \s*)?
+        %?[A-Z][A-Za-z0-9.%]{3,}
+        (?: \s* \[ \s* @@[A-Za-z0-9.%]* \s* \]
+          | \s* \[\[ \s* [A-Za-z0-9.%]* \s* \]\] )?
+        \s* \( (.*) \) \s*
+    |
+        new \s* (?:Map|Set) \s*
+    )
+    (?: Abstract \s+ Operation \s*)?
+    $
+''')
+argument_ignore_re = re.compile(r'\.\s*\.\s*\.|\[|\]|' + "\N{HORIZONTAL ELLIPSIS}")
+argument_name_re = re.compile(r'^\s*(?:\.\s*\.\s*\.\s*)?(\w+)\s*(?:=.*)?$')
+
 def title_get_argument_names(title):
     """ Given a section title, return a list of argument names.
 
@@ -321,32 +398,11 @@ def title_get_argument_names(title):
         using_hack("fixup_vars_tweak_19.1.2.3.1")
         title = title.replace(" O. Prop", " O, Prop")
 
-    algorithm_arguments_re = r'''(?x)
-        ^
-        # Ignore optional section number.
-        (?: \d+ (?: \. \d+ )* \s* )?
-        # Ignore optional "Runtime Semantics:" label
-        (?: (?:Runtime|Static) \s* Semantics \s* : \s* )?
-        # Actual algorithm name
-        (?:
-            (?: new \s*)?
-            %?[A-Z][A-Za-z0-9.%]{3,}
-            (?: \s* \[ \s* @@[A-Za-z0-9.%]* \s* \]
-              | \s* \[\[ \s* [A-Za-z0-9.%]* \s* \]\] )?
-            \s* \( (.*) \) \s*
-        |
-            new \s* (?:Map|Set) \s*
-        )
-        (?: Abstract \s+ Operation \s*)?
-        $
-    '''
-
-    m = re.match(algorithm_arguments_re, title)
+    m = algorithm_arguments_re.match(title)
     if m is None:
         return []
     arguments = m.group(1)
-    ignore_re = r'\.\s*\.\s*\.|\[|\]|' + "\N{HORIZONTAL ELLIPSIS}"
-    arguments = re.sub(ignore_re, '', arguments)
+    arguments = argument_ignore_re.sub('', arguments)
     arguments = arguments.strip()
     if arguments == '' or arguments == 'all other argument combinations':
         return []
@@ -356,7 +412,7 @@ def title_get_argument_names(title):
     for piece in pieces:
         if piece.strip() == '':
             continue
-        m = re.match(r'^\s*(?:\.\s*\.\s*\.\s*)?(\w+)\s*(?:=.*)?$', piece)
+        m = argument_name_re.match(piece)
         if m is None:
             if piece == "reserved1  .":
                 warn("FIXME working around https://bugs.ecmascript.org/show_bug.cgi?id=2626")
@@ -373,10 +429,18 @@ def title_get_argument_names(title):
 def ht_text(ht):
     if isinstance(ht, str):
         return ht
-    elif isinstance(ht, list):
-        return ''.join(map(ht_text, ht))
-    else:
-        return ht_text(ht.content)
+    parts = []
+    stack = [iter(ht if isinstance(ht, list) else ht.content)]
+    while stack:
+        for k in stack[-1]:
+            if isinstance(k, str):
+                parts.append(k)
+            else:
+                stack.append(iter(k.content))
+                break
+        else:
+            stack.pop()
+    return ''.join(parts)
 
 tag_names = {
     'ANNEX': 'h1.l1',
@@ -433,195 +497,189 @@ tag_names = {
     'zzSTDTitle': 'div.inner-title'
 }
 
-heading_styles = {k for k, v in tag_names.items()
-                        if v == 'h1' or v == 'h2' or (v is not None and v.startswith('h1.'))}
-
-@Fixup
-def fixup_vars(doc, docx):
-    """
-    Convert italicized variable names to <var> elements.
-    """
+heading_styles = frozenset(k for k, v in tag_names.items()
+                           if v == 'h1' or v == 'h2' or (v is not None and v.startswith('h1.')))
 
-    declare_hack("fixup_vars_tweak_19.1.2.3.1")
+prose_token_re = re.compile(r'(?:\s*)([0-9A-Za-z_-]+|.)')
+prose_word_re = re.compile(r'^[a-zA-Z0-9_-]+$')
 
-    def slices_by(iterable, break_before):
-        """Break an iterable into slices, using the given predicate
-        to determine when to break. Yields nonempty lists.
+class ProseParser:
+    def __init__(self, text):
+        self.text = text
+        self.tokens = prose_token_re.findall(text)
+        self.i = 0
 
-        `slice_by(range(6), is_even)` would yield [0, 1], then [2, 3],
-        then [4, 5].
-        """
-        x = []
-        for v in iterable:
-            if break_before(v):
-                if x:
-                    yield x
-                    x = []
-            x.append(v)
-        if x:
-            yield x
+    def parse(self):
+        tokens = self.tokens
+        n = len(tokens)
+        hits = []
+        while self.i < n:
+            i = self.i
+            if (tokens[i] == 'is' and i + 2 < n
+                    and tokens[i + 1] == 'called' and tokens[i + 2] == 'with'):
+                #print("OK", tokens[self.i:self.i + 20])
+
+                # look back to match 'method of Obj is called with'
+                if i >= 3 and tokens[i - 3] == 'method' and tokens[i - 2] == 'of':
+                    hits.append(tokens[i - 1])
+                i += 3  # skip "is called with"
+
+                # skip these pointless phrases if they appear...
+                if (i + 2 < n and tokens[i] == 'a'
+                        and tokens[i + 1] == 'single' and tokens[i + 2] == 'parameter'):
+                    i += 3
+                elif i < n and tokens[i] == 'parameters':
+                    i += 1
+                self.i = i
 
-    def is_heading(p):
-        return ht_name_is(p, 'p') and p.attrs.get('class', '') in heading_styles
-
-    class ProseParser:
-        def __init__(self, text):
-            self.text = text
-            self.tokens = re.findall(r'(?:\s*)([0-9A-Za-z_-]+|.)', text)
-            self.i = 0
-
-        def parse(self):
-            tokens = self.tokens
-            n = len(tokens)
-            hits = []
-            while self.i < n:
-                if tokens[self.i:self.i + 3] == ['is', 'called', 'with']:
-                    #print("OK", tokens[self.i:self.i + 20])
-
-                    # look back to match 'method of Obj is called with'
-                    if self.i >= 3 and tokens[self.i - 3:self.i - 1] == ['method', 'of']:
-                        hits.append(tokens[self.i - 1])
-                    self.i += 3  # skip "is called with"
-
-                    # skip these pointless phrases if they appear...
-                    if tokens[self.i:self.i + 3] == ['a', 'single', 'parameter']:
-                        self.i += 3
-                    elif tokens[self.i:self.i + 1] == ['parameters']:
-                        self.i += 1
-
-                    result = self.parse_arg()
-                    if result is None:
-                        warn("parse failed in {!r}".format(self.text))
-                    else:
-                        hits.append(result)
-                        while ((self.skip_optional(",") and not self.i == len(self.tokens))
-                               or self.looking_at("and")):
-                            if self.skip_optional("and"):
-                                self.skip_optional("with")  # lame
-                            result = self.parse_arg()
-                            if result is None:
-                                warn("parse failed in {!r} after ','".format(self.text))
-                            else:
-                                hits.append(result)
+                result = self.parse_arg()
+                if result is None:
+                    warn("parse failed in {!r}".format(self.text))
                 else:
-                    self.i += 1
-            return hits
-
-        def looking_at(self, *options):
-            return self.i < len(self.tokens) and self.tokens[self.i] in options
-
-        def skip_optional(self, *options):
-            hit = self.looking_at(*options)
-            if hit:
-                self.i += 1
-            return hit
-
-        def parse_arg(self):
-            # Arg : "optionally"_opt Article_opt Type_opt "argument"_opt Identifier Suffix_opt
-            # Article : one of "a" "an"
-            self.skip_optional("optionally")
-            self.skip_optional("a", "an")
-            self.skip_optional_type(deferring=True)
-            self.skip_optional("as")
-            self.skip_optional("argument", "arguments")
-            tokens = self.tokens
-            n = len(tokens)
-            i = self.i
-            if i >= n:
-                return None
-            t = tokens[i]
-            if re.match(r'^[a-zA-Z0-9_-]+$', t) is not None and t not in ('and', 'where'):
+                    hits.append(result)
+                    while ((self.skip_optional(",") and not self.i == len(self.tokens))
+                           or self.looking_at("and")):
+                        if self.skip_optional("and"):
+                            self.skip_optional("with")  # lame
+                        result = self.parse_arg()
+                        if result is None:
+                            warn("parse failed in {!r} after ','".format(self.text))
+                        else:
+                            hits.append(result)
+            else:
                 self.i += 1
-                self.skip_optional_suffix()
-                return t
+        return hits
+
+    def looking_at(self, *options):
+        return self.i < len(self.tokens) and self.tokens[self.i] in options
+
+    def skip_optional(self, *options):
+        hit = self.looking_at(*options)
+        if hit:
+            self.i += 1
+        return hit
+
+    def parse_arg(self):
+        # Arg : "optionally"_opt Article_opt Type_opt "argument"_opt Identifier Suffix_opt
+        # Article : one of "a" "an"
+        self.skip_optional("optionally")
+        self.skip_optional("a", "an")
+        self.skip_optional_type(deferring=True)
+        self.skip_optional("as")
+        self.skip_optional("argument", "arguments")
+        tokens = self.tokens
+        n = len(tokens)
+        i = self.i
+        if i >= n:
             return None
+        t = tokens[i]
+        if prose_word_re.match(t) is not None and t not in ('and', 'where'):
+            self.i += 1
+            self.skip_optional_suffix()
+            return t
+        return None
 
-        def skip_optional_suffix(self):
-            # Suffix : "," Article Type [lookahead in {".", ","}]
-            tokens = self.tokens
-            n = len(tokens)
-            i = self.i
-            if i >= n:
-                return
-
-            if tokens[i] != ",":
-                return
-            i += 1
-            if i >= n:
-                return
-
-            if tokens[i] not in ("a", "an"):
-                return
-            i += 1
-            if i >= n:
-                return
+    def skip_optional_suffix(self):
+        # Suffix : "," Article Type [lookahead in {".", ","}]
+        tokens = self.tokens
+        n = len(tokens)
+        i = self.i
+        if i >= n:
+            return
 
-            # Transactionally attempt skip_optional_type and roll all the way
-            # back to the beginning if it doesn't match.
-            saved_place = self.i
-            self.i = i
-            self.skip_optional_type(deferring=False)
-            if self.i == i or not (self.looking_at(",") or self.looking_at(".")):
-                # No match! Roll back.
-                self.i = saved_place
+        if tokens[i] != ",":
+            return
+        i += 1
+        if i >= n:
+            return
 
-        def skip_optional_type(self, deferring):
-            if self.skip_optional("ECMAScript"):
-                self.skip_optional("language")
+        if tokens[i] not in ("a", "an"):
+            return
+        i += 1
+        if i >= n:
+            return
 
-            tokens = self.tokens
-            n = len(tokens)
-            i = self.i
-            if i >= n:
-                return
+        # Transactionally attempt skip_optional_type and roll all the way
+        # back to the beginning if it doesn't match.
+        saved_place = self.i
+        self.i = i
+        self.skip_optional_type(deferring=False)
+        if self.i == i or not (self.looking_at(",") or self.looking_at(".")):
+            # No match! Roll back.
+            self.i = saved_place
+
+    def skip_optional_type(self, deferring):
+        if self.skip_optional("ECMAScript"):
+            self.skip_optional("language")
+
+        tokens = self.tokens
+        n = len(tokens)
+        i = self.i
+        if i >= n:
+            return
 
-            tok = tokens[i].lower()
+        tok = tokens[i].lower()
 
-            if tok == 'list':
-                self.i += 1
-                if i + 1 < len(tokens) and tokens[i + 1] == 'of':
-                    self.i += 1
-                    self.skip_optional_type(deferring=False)
-            elif tok == 'either':
+        if tok == 'list':
+            self.i += 1
+            if i + 1 < len(tokens) and tokens[i + 1] == 'of':
                 self.i += 1
-                self.skip_optional("a", "an")
-                self.skip_optional_type(deferring=False)
-                if self.skip_optional("or"):
-                    self.skip_optional("with")  # mmmmm rather bogus, grammatically
-                self.skip_optional("a", "an")
                 self.skip_optional_type(deferring=False)
-            else:
-                for t in types:
-                    if [w.lower() for w in tokens[i:i + len(t)]] == t:
-                        if deferring and i + len(t) < len(tokens) and tokens[i + len(t)] == ',':
-                            # In "is called with argument string," don't treat
-                            # "string" as a type. It's the argument name.
-                            return
-                        self.i += len(t)
+        elif tok == 'either':
+            self.i += 1
+            self.skip_optional("a", "an")
+            self.skip_optional_type(deferring=False)
+            if self.skip_optional("or"):
+                self.skip_optional("with")  # mmmmm rather bogus, grammatically
+            self.skip_optional("a", "an")
+            self.skip_optional_type(deferring=False)
+        else:
+            for t in prose_types_by_first_word.get(tok, ()):
+                if all(i + j < n and tokens[i + j].lower() == w
+                       for j, w in enumerate(t[1:], 1)):
+                    if deferring and i + len(t) < len(tokens) and tokens[i + len(t)] == ',':
+                        # In "is called with argument string," don't treat
+                        # "string" as a type. It's the argument name.
                         return
-
-    types = [[w.lower() for w in s.split()] for s in [
-        'object',
-        'integer',
-        'string',
-        'null',
-        'boolean flag',
-        'boolean value',
-        'boolean',
-        'Property Descriptor',
-        'Property Descriptors',
-        'Lexical Environment',
-        'environment record',
-        'grammar production',
-        'value',
-        'values',
-        'function Object',
-        'property key'
-    ]]
-
-    def para_get_argument_names(para):
-        text = ht_text(para)
-        return ProseParser(text).parse()
+                    self.i += len(t)
+                    return
+
+prose_types = [[w.lower() for w in s.split()] for s in [
+    'object',
+    'integer',
+    'string',
+    'null',
+    'boolean flag',
+    'boolean value',
+    'boolean',
+    'Property Descriptor',
+    'Property Descriptors',
+    'Lexical Environment',
+    'environment record',
+    'grammar production',
+    'value',
+    'values',
+    'function Object',
+    'property key'
+]]
+
+# Candidate types for skip_optional_type, by first word, longest match first
+# as in prose_types.
+prose_types_by_first_word = {}
+for words in prose_types:
+    prose_types_by_first_word.setdefault(words[0], []).append(words)
+
+def para_get_argument_names(para):
+    text = ht_text(para)
+    return ProseParser(text).parse()
+
+prose_parser_checked = False
+
+def check_prose_parser():
+    """ Run para_get_argument_names on some canned sentences, once per process. """
+    global prose_parser_checked
+    if prose_parser_checked:
+        return
 
     def testp(text, expected):
         actual = list(para_get_argument_names(text))
@@ -671,6 +729,39 @@ def fixup_vars(doc, docx):
           "environment record env.",
           "func formals argumentsList env")
 
+    prose_parser_checked = True
+
+@Fixup
+def fixup_vars(doc, docx):
+    """
+    Convert italicized variable names to <var> elements.
+    """
+
+    declare_hack("fixup_vars_tweak_19.1.2.3.1")
+    if __debug__:
+        check_prose_parser()
+
+    def slices_by(iterable, break_before):
+        """Break an iterable into slices, using the given predicate
+        to determine when to break. Yields nonempty lists.
+
+        `slice_by(range(6), is_even)` would yield [0, 1], then [2, 3],
+        then [4, 5].
+        """
+        x = []
+        for v in iterable:
+            if break_before(v):
+                if x:
+                    yield x
+                    x = []
+            x.append(v)
+        if x:
+            yield x
+
+    def is_heading(p):
+        return (not isinstance(p, str) and p.name == 'p'
+                and p.attrs.get('class') in heading_styles)
+
     def markup_vars(section):
         if not is_heading(section[0]):
             return section  # unchanged.
@@ -724,8 +815,10 @@ def fixup_vars(doc, docx):
 
 
 
+nonterminal_re = re.compile(r'^(?:uri(?:[A-Z][A-Za-z0-9]*)?|[A-Z]+[a-z][A-Za-z0-9]*)$')
+
 def looks_like_nonterminal(text):
-    return re.match(r'^(?:uri(?:[A-Z][A-Za-z0-9]*)?|[A-Z]+[a-z][A-Za-z0-9]*)$', text) is not None
+    return nonterminal_re.match(text) is not None
 
 def is_marker(e):
     return ht_name_is(e, 'span') and e.attrs.get('class') == 'marker'
@@ -751,17 +844,14 @@ def fixup_formatting(doc, docx):
 
     def new_span(content, style):
         # Merge adjacent strings, if any.
-        i = 0
-        while i < len(content) - 1:
-            a = content[i]
-            b = content[i + 1]
-            if isinstance(a, str) and isinstance(b, str):
-                content[i] = a + b
-                del content[i + 1]
+        merged = []
+        for ht in content:
+            if isinstance(ht, str) and merged and isinstance(merged[-1], str):
+                merged[-1] += ht
             else:
-                i += 1
+                merged.append(ht)
 
-        result = html.span(*content)
+        result = html.span(*merged)
         if style:
             result.style = style
         return result
@@ -778,14 +868,24 @@ def fixup_formatting(doc, docx):
         cls = parent.attrs['class']
         inherited_style = docx.styles[cls].full_style
 
-        # Determine the style of each run of content in the paragraph.
+        # Determine the style of each run of content in the paragraph. Runs
+        # with the same formatting share a single style dict.
         items = []
+        run_styles = {}
+        all_runs_inherit = True
         for kid in parent.content[rewritable_content_start:]:
             if not isinstance(kid, str) and kid.name == 'span':
-                run_style = inherited_style.copy()
-                run_style.update(kid.style)
-                if 'class' in kid.attrs:
-                    run_style.update(docx.styles[kid.attrs['class']].full_style)
+                kid_cls = kid.attrs.get('class')
+                if kid.style or kid_cls is not None:
+                    all_runs_inherit = False
+                key = tuple(kid.style.items()), kid_cls
+                run_style = run_styles.get(key)
+                if run_style is None:
+                    run_style = inherited_style.copy()
+                    run_style.update(kid.style)
+                    if kid_cls is not None:
+                        run_style.update(docx.styles[kid_cls].full_style)
+                    run_styles[key] = run_style
                 items.append((kid.content, run_style))
             else:
                 items.append(([kid], inherited_style))
@@ -794,6 +894,17 @@ def fixup_formatting(doc, docx):
         while items and all(isinstance(ht, str) and ht.isspace() for ht in items[-1][0]):
             del items[-1]
 
+        # Fast path: if no run has formatting of its own, and the paragraph
+        # style isn't monospace (which is never treated as the paragraph's
+        # font, below), there are no ranges to build. The runs are unwrapped.
+        if all_runs_inherit and inherited_style.get('font-family') != 'monospace':
+            all_content = []
+            for content, _ in items:
+                all_content += content
+            return [parent.with_content_slice(rewritable_content_start,
+                                              len(parent.content),
+                                              all_content)]
+
         # If the paragraph begins and ends in the same font, treat that font
         # as the paragraph's font, which we will drop.
         paragraph_style = inherited_style.copy()
@@ -826,8 +937,17 @@ def fixup_formatting(doc, docx):
                     assert current_style[prop][1] == val
             assert {k: v for k, (_, v) in current_style.items()} == style
 
+        relative_styles = {}  # id(run_style) -> the part paragraph_style doesn't cover
+        style = None
         for content, run_style in items:
-            set_current_style_to({p: v for p, v in run_style.items() if paragraph_style.get(p) != v})
+            previous_style = style
+            style = relative_styles.get(id(run_style))
+            if style is None:
+                style = {p: v for p, v in run_style.items() if paragraph_style.get(p) != v}
+                relative_styles[id(run_style)] = style
+            # Runs sharing a style dict (see above) continue the same ranges.
+            if style is not previous_style:
+                set_current_style_to(style)
             all_content += content
         set_current_style_to({})
 
@@ -835,43 +955,53 @@ def fixup_formatting(doc, docx):
         ranges = [(start, stop, style) for (start, stop), style in ranges.items()]
         ranges.sort(key=lambda triple: (triple[0], -triple[1]))
 
-        def build_result(ranges, i0, i1):
-            result = []
+        def build_result(ranges, i0, i1, result):
+            """ Append the content all_content[i0:i1] to result, wrapped in
+            spans as described by ranges, which is sorted by start. """
+            k = 0
+            n = len(ranges)
             content_index = i0
-            while ranges:
-                start, stop, style = ranges[0]
+            while k < n:
+                start, stop, style = ranges[k]
                 assert i0 <= start < stop <= i1
                 assert content_index <= start
                 result += all_content[content_index:start]  # add any plain content
 
-                # split 'ranges' into two parts
+                # The ranges that start before this one stops come right after
+                # it. They go inside it, split at stop if they extend past it.
                 inner_ranges = []
-                after_ranges = []
-                for triple in ranges[1:]:
+                straddling_tails = []
+                k += 1
+                while k < n and ranges[k][0] < stop:
+                    triple = ranges[k]
                     r0, r1, rs = triple
                     assert start <= r0 < r1 <= i1
                     if r1 <= stop:
                         inner_ranges.append(triple)
-                    elif stop <= r0:
-                        after_ranges.append(triple)
                     else:
                         # the gross case, hopefully rare
                         inner_ranges.append((r0, stop, rs))
-                        after_ranges.append((stop, r1, rs))
+                        straddling_tails.append((stop, r1, rs))
+                    k += 1
+                if straddling_tails:
+                    ranges = straddling_tails + ranges[k:]
+                    k = 0
+                    n = len(ranges)
 
                 # recurse to build the child, add that to the result
-                child_content = build_result(inner_ranges, start, stop)
+                child_content = []
+                build_result(inner_ranges, start, stop, child_content)
                 result.append(new_span(child_content, style))
 
                 content_index = stop
-                ranges = after_ranges
 
             result += all_content[content_index:i1]  # add any trailing plain content
-            return result
 
+        result = []
+        build_result(ranges, 0, len(all_content), result)
         return [parent.with_content_slice(rewritable_content_start,
                                           len(parent.content),
-                                          build_result(ranges, 0, len(all_content)))]
+                                          result)]
 
     return doc.replace('p', rewrite_spans)
 
@@ -901,6 +1031,8 @@ def fixup_lists(doc, docx):
     List = collections.namedtuple('List', ['parent', 'left_margin', 'content',
                                            'numId', 'ilvl', 'marker_type'])
 
+    list_marker_re = re.compile(r'^(?:\uf0b7|[1-9][0-9]*\.|[a-z]\.?|[ivxlcdm]+\.)\t$')
+
     def without_numbering_info(style):
         """ Return a dictionary just like style but without numbering entries. """
         s = None
@@ -970,16 +1102,20 @@ def fixup_lists(doc, docx):
             assert current is not None
 
         for i, p in enumerate(body.content):
+            style = p.style or {}
+            content = p.content
+
             # Get numbering info for this paragraph.
             numId = ilvl = None
-            if p.style and '-ooxml-numId' in p.style and p.style['-ooxml-numId'] != '0':
-                numId = int(p.style['-ooxml-numId'])
-                ilvl = int(p.style.get('-ooxml-ilvl', '0'))
+            numId_str = style.get('-ooxml-numId')
+            if numId_str is not None and numId_str != '0':
+                numId = int(numId_str)
+                ilvl = int(style.get('-ooxml-ilvl', '0'))
 
             # Determine the indentation depth.
             margin = 0.0
-            if p.style and '-ooxml-indentation' in p.style:
-                margin_str = p.style['-ooxml-indentation']
+            margin_str = style.get('-ooxml-indentation')
+            if margin_str is not None:
                 if margin_str.endswith('pt'):
                     margin = float(margin_str[:-2])
                 else:
@@ -989,10 +1125,9 @@ def fixup_lists(doc, docx):
             is_list_item = (numId is not None
                             and numId != 0
                             and p.attrs.get('class') not in heading_styles
-                            and len(p.content) != 0
-                            and is_marker(p.content[0])
-                            and re.match(r'^(?:\uf0b7|[1-9][0-9]*\.|[a-z]\.?|[ivxlcdm]+\.)\t$',
-                                         p.content[0].content[0]))
+                            and len(content) != 0
+                            and is_marker(content[0])
+                            and list_marker_re.match(content[0].content[0]))
 
             # Close any more-indented active lists.
             #
@@ -1010,10 +1145,12 @@ def fixup_lists(doc, docx):
                 close_list()
 
             if not is_list_item:
-                if p.style and '-ooxml-numId' in p.style:
-                    p = p.with_(style=without_numbering_info(p.style))
+                if '-ooxml-numId' in style:
+                    p = p.with_(style=without_numbering_info(style))
                 append_non_list_item(p)
             else:
+                marker_str = content[0].content[0]
+
                 # If it is indented more than the previous paragraph, open a
                 # new list.
                 if margin > current.left_margin:
@@ -1021,8 +1158,7 @@ def fixup_lists(doc, docx):
                 # HACK: if we see numbered lists and bullet lists with
                 # the same indentation level (ouch), assume the numbered list is
                 # nested inside the bulleted one (aaaaarrrrrgh).
-                elif (current.marker_type == 'bullet'
-                      and p.content[0].content[0] != '\uf0b7\t'):
+                elif current.marker_type == 'bullet' and marker_str != '\uf0b7\t':
                     using_hack("fixup_lists_unindented_nested_lists")
                     open_list(p, numId, ilvl, margin)
 
@@ -1036,14 +1172,13 @@ def fixup_lists(doc, docx):
                     attrs = attrs.copy()
                     del attrs['class']
                 li = p.with_(name='li',
-                             content=p.content[1:],
+                             content=content[1:],
                              attrs=attrs,
-                             style=without_numbering_info(p.style))
+                             style=without_numbering_info(style))
                 current.content.append(li)
 
                 # Assert that the marker HTML will generate for this list item
                 # is the same as the one that appears in the Word doc.
-                marker_str = p.content[0].content[0]
                 if current.marker_type == 'bullet':
                     # U+F0B7 is not a Unicode character, this is Word nonsense
                     if marker_str != '\uf0b7\t':
@@ -1269,16 +1404,21 @@ def fixup_hr(doc, docx):
         return results
 
     def bubble_up_hr(p):
+        # Split p at each <hr>, dropping pieces that are only whitespace.
+        result = []
+        start = 0
         for i, hr in p.kids('hr'):
-            result = [hr]
-            head = p.content[:i]
+            head = p.content[start:i]
             if not all(isinstance(ht, str) and ht.isspace() for ht in head):
-                result.insert(0, p.with_content(head))
-            tail = p.content[i + 1:]
-            if not all(isinstance(ht, str) and ht.isspace() for ht in tail):
-                result += bubble_up_hr(p.with_content(head))
-            return result
-        return [p]
+                result.append(p.with_content(head))
+            result.append(hr)
+            start = i + 1
+        if start == 0:
+            return [p]
+        tail = p.content[start:]
+        if not all(isinstance(ht, str) and ht.isspace() for ht in tail):
+            result.append(p.with_content(tail))
+        return result
 
     return doc.replace('p', bubble_up_hr)
 
@@ -1301,8 +1441,10 @@ def fixup_sections(doc, docx):
     body_elt = doc_body(doc)
     body = body_elt.content
 
+    section_number_re = re.compile(r'[1-9]|[A-Z]\.[1-9][0-9]*')
+
     def starts_with_section_number(s):
-        return re.match(r'[1-9]|[A-Z]\.[1-9][0-9]*', s) is not None
+        return section_number_re.match(s) is not None
 
     def heading_info(h):
         """
@@ -1343,7 +1485,10 @@ def fixup_sections(doc, docx):
                         assert isinstance(item, str)
                         title += item
                 h.content = [num + '\t', html.span(status, class_="section-status"), " " + title.strip()]
-                return num.strip(), title
+                # The title is now part of the heading's content, after the
+                # status, so there is nothing more for wrap to add. This is
+                # also what a second call on the rewritten heading returns.
+                return num.strip(), ''
             elif starts_with_section_number(s):
                 parts = s.split(None, 1)
                 if len(parts) == 2:
@@ -1389,7 +1534,7 @@ def fixup_sections(doc, docx):
                     if sec_title == "Copyright notice":
                         break
                 elif kid.name == 'h1':
-                    kid_num, kid_title = heading_info(kid)
+                    kid_num, kid_title = infos[id(kid)]
 
                     # Hack: most numberless sections are subsections, but the
                     # Bibliography is not contained in any other section.
@@ -1415,17 +1560,18 @@ def fixup_sections(doc, docx):
         # Actually do the wrapping.
         body[start:stop] = [html.section(*body[start:stop], **attrs)]
 
+    # heading_info rewrites some headings, so call it exactly once per
+    # heading, before any wrapping.
+    infos = {id(kid): heading_info(kid) for _, kid in body_elt.kids("h1")}
     for i, kid in body_elt.kids("h1"):
-        num, title = heading_info(kid)
+        num, title = infos[id(kid)]
         wrap(num, title, i)
 
     # remove some h1 attributes that we don't need anymore (or never needed)
     for h in findall(doc, 'h1'):
-        if h.style.get('-ooxml-numId') != None:
-            del h.style['-ooxml-numId']
+        if h.style.pop('-ooxml-numId', None) is not None:
             del h.style['-ooxml-ilvl']
-        if h.attrs.get('class') != None:
-            del h.attrs['class']
+        h.attrs.pop('class', None)
 
 def is_section_with_title(e, title):
     if e.name != 'section':
@@ -1473,38 +1619,40 @@ def fixup_insert_section_ids(doc, docx):
             secnum = secnum_str
         return (heading, span_secnum, secnum_str, secnum)
 
+    mangle_token_re = re.compile(r'''(?x)
+        \s*
+        (
+            \.\.\.
+            | \. \s+ \. \s+ \.
+            | [0-9A-Za-z_\.@:-]+
+            | %[A-Za-z]+% (?: \. [0-9A-Za-z_\.@]+ )?
+            | \[\[ [A-Za-z]+ \]\]
+            | " [0-9A-Za-z_:]+ "
+            | \[ \s* @@[A-Za-z]+ \s* \]
+            | = \s* [A-Za-z0-9]+
+            | .
+        )
+    ''')
+
+    token_names = {
+        "(": None,
+        ")": None,
+        ",": None,
+        "\N{HORIZONTAL ELLIPSIS}": None,
+        "...": None,
+        "+": "plus",
+        "-": "minus",
+        "*": "mul",
+        "/": "div",
+        "%": "mod"
+    }
+
+    @functools.lru_cache(maxsize=None)
     def mangle(title):
         # This is unicode-hostile. The goal is to have simple, typeable ids.
         # I don't know that any headings use any non-ASCII characters
         # other than punctuation.
-        token_re = r'''(?x)
-            \s*
-            (
-                \.\.\.
-                | \. \s+ \. \s+ \.
-                | [0-9A-Za-z_\.@:-]+
-                | %[A-Za-z]+% (?: \. [0-9A-Za-z_\.@]+ )?
-                | \[\[ [A-Za-z]+ \]\]
-                | " [0-9A-Za-z_:]+ "
-                | \[ \s* @@[A-Za-z]+ \s* \]
-                | = \s* [A-Za-z0-9]+
-                | .
-            )
-        '''
-        tokens = re.findall(token_re, title)
-
-        token_names = {
-            "(": None,
-            ")": None,
-            ",": None,
-            "\N{HORIZONTAL ELLIPSIS}": None,
-            "...": None,
-            "+": "plus",
-            "-": "minus",
-            "*": "mul",
-            "/": "div",
-            "%": "mod"
-        }
+        tokens = mangle_token_re.findall(title)
 
         words = []
         for t in tokens:
@@ -1549,13 +1697,15 @@ def fixup_insert_section_ids(doc, docx):
     # we could give it.
     candidates = {}
     HACK_section_remapping = {}
+    duplicate_counts = collections.defaultdict(int)
     for section in doc.find(match):
         heading, span_secnum, secnum_str, secnum = split_section(section)
 
         if secnum in candidates:
             using_hack("multiple-sections-have-the-same-number")
             warn("multiple sections have the number " + secnum)
-            bolt_on = len([1 for sec in candidates if sec.startswith(secnum + "_")])
+            bolt_on = duplicate_counts[secnum]
+            duplicate_counts[secnum] += 1
             secnum += "_" + str(bolt_on)
             HACK_section_remapping[ht_text(heading)] = secnum
 
@@ -1585,15 +1735,18 @@ def fixup_insert_section_ids(doc, docx):
         # use the section number and title.
         candidates[secnum].append(secnum + '-' + candidates[secnum][0])
 
-    # Use a Counter to find out which ids are duplicates, and assign to each
-    # section the first id on its list that could not possibly be the id of any
-    # other section in the document.
-    counts = collections.Counter(idc for idlist in candidates.values()
-                                         for idc in idlist)
+    # Find out which section, if any, each id uniquely belongs to, and assign
+    # to each section the first id on its list that could not possibly be the
+    # id of any other section in the document. An id that appears twice, even
+    # in the same section's list, belongs to no section.
+    owners = {}
+    for secnum, idlist in candidates.items():
+        for idc in idlist:
+            owners[idc] = None if idc in owners else secnum
     section_ids = {}
     for secnum, idlist in sorted(candidates.items()):
         for id in idlist:
-            if counts[id] == 1:
+            if owners[id] == secnum:
                 section_ids[secnum] = "sec-" + id
                 break
         else:
@@ -2182,7 +2335,7 @@ def fixup_html_head(doc, docx):
     title = title.replace(' - ', ' \N{EN DASH} ')
 
     # Compute the filename of the script we use for coping with change.
-    base, _ = os.path.splitext(os.path.basename(docx.filename))
+    base, _ = os.path.splitext(docx.basename)
     sections_script = base + "-sections.js"
 
     return doc.with_(
@@ -2405,15 +2558,18 @@ def fixup_lang_grammar_pre(doc, docx):
             previous_was_code = ht_is_code
         return s
 
-    def is_lhs(text):
-        text = re.sub(r'''(?x)
+    lhs_suffix_re = re.compile(r'''(?x)
             (\s+ one \s+ of -?)?
             (\s+ See \s+
                 (            ({\ REF [^}]* })?   (\d+|[A-Z])(.\d+)*
                 | clause \s* ({\ REF [^}]* })?   \d+
                 )
             )?
-            $''', '', text)
+            $''')
+    see_ref_macro_re = re.compile(r'(\sSee\s+(clause\s+)?){ REF[^}]*}')
+
+    def is_lhs(text):
+        text = lhs_suffix_re.sub('', text)
         return text.endswith(':')
 
     def strip_grammar_block(parent, i):
@@ -2435,7 +2591,7 @@ def fixup_lang_grammar_pre(doc, docx):
 
                 if is_lhs(line):
                     syntax += '\n'  # blank line before
-                    line = re.sub(r'(\sSee\s+(clause\s+)?){ REF[^}]*}', r'\1', line)  # strip macro if present
+                    line = see_ref_macro_re.sub(r'\1', line)  # strip macro if present
                 else:
                     syntax += '    '  # indent each rhs
                 syntax += line + '\n'
@@ -2763,6 +2919,29 @@ def fixup_intl_insert_ids(doc, docx):
                         p.content.insert(1, html.span(id = id, *id))
                         p.content[2] = content[len(prefix + id):]
 
+algorithm_name_re = re.compile(r'''(?x)
+    ^
+    # Ignore optional "Runtime Semantics:" label
+    (?: (?:Runtime|Static) \s* Semantics \s* : \s* )?
+    # Actual algorithm name
+    (
+        %?[A-Z][A-Za-z0-9.%]{3,}
+        (?: \s* \[ \s* @@[A-Za-z0-9.%]* \s* \]
+          | \s* \[\[ \s* [A-Za-z0-9.%]* \s* \]\] )?
+    )
+    (?:
+        # Arguments (or something else in parentheses);
+        # or "Abstract Operation/Concrete Method"; or both.
+        (?: \s* \( .* \) )? \s* (?: Abstract \s+ Operation \s* |
+                                    Concrete \s+ Method \s* )
+        | \s* \( .* \)
+    )
+    (?: \s* ---- .* )?   # Dash followed by a gloss
+    $
+'''.replace("----", "\N{EM DASH}"))
+camel_case_name_re = re.compile(r'[A-Z][a-z]+[A-Z][A-Za-z0-9]+')
+
+@functools.lru_cache(maxsize=None)
 def title_as_algorithm_name(title, secnum):
     pattern_semantics_section_prefix = '21.2.2.'  # "Pattern Semantics"
     if secnum.startswith(pattern_semantics_section_prefix):
@@ -2770,32 +2949,11 @@ def title_as_algorithm_name(title, secnum):
         # Not an algorithm or builtin-method name. Skip it for now.
         return None
 
-    algorithm_name_re = r'''(?x)
-        ^
-        # Ignore optional "Runtime Semantics:" label
-        (?: (?:Runtime|Static) \s* Semantics \s* : \s* )?
-        # Actual algorithm name
-        (
-            %?[A-Z][A-Za-z0-9.%]{3,}
-            (?: \s* \[ \s* @@[A-Za-z0-9.%]* \s* \]
-              | \s* \[\[ \s* [A-Za-z0-9.%]* \s* \]\] )?
-        )
-        (?:
-            # Arguments (or something else in parentheses);
-            # or "Abstract Operation/Concrete Method"; or both.
-            (?: \s* \( .* \) )? \s* (?: Abstract \s+ Operation \s* |
-                                        Concrete \s+ Method \s* )
-            | \s* \( .* \)
-        )
-        (?: \s* ---- .* )?   # Dash followed by a gloss
-        $
-    '''.replace("----", "\N{EM DASH}")
-
-    m = re.match(algorithm_name_re, title)
+    m = algorithm_name_re.match(title)
     if m is not None:
         return m.group(1)
     # Also allow matches like "ToPrimitive".
-    if re.match(r'[A-Z][a-z]+[A-Z][A-Za-z0-9]+', title) is not None:
+    if camel_case_name_re.match(title) is not None:
         return title
     return None
 
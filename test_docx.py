@@ -0,0 +1,21 @@
+import io
+import unittest
+
+import docx
+
+
+W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+
+class IterChildrenTests(unittest.TestCase):
+    def test_skips_children_off_the_path(self):
+        xml = ('<w:document xmlns:w="' + W + '">'
+               '<w:background w:color="FFFFFF"><w:p/></w:background>'
+               '<w:body><w:p><w:r/></w:p><w:tbl/></w:body>'
+               '</w:document>').encode()
+        children = list(docx.iter_children(io.BytesIO(xml), docx.k_document, docx.k_body))
+        self.assertEqual([e.tag for e in children], [docx.bloat('p'), docx.bloat('tbl')])
+
+
+if __name__ == '__main__':
+    unittest.main()
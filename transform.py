@@ -1,5 +1,5 @@
-from xml.etree import ElementTree
 from htmodel import *
+from xml.etree import ElementTree
 from docx import shorten, parse_pr
 
 def dict_to_css(d):
@@ -12,7 +12,14 @@ ALLOW_CHANGES = True
 # === main
 
 def transform(docx):
-    return transform_element(docx, docx.document)
+    """ Convert the body of a docx document to a rough HTML tree.
+
+    document.xml is streamed: each top-level paragraph or table in the body is
+    converted as soon as it has been parsed and then thrown away, so that the
+    whole XML tree and the whole HTML tree never have to be in memory at once.
+    """
+    css, c = transform_children(docx, docx.iter_body())
+    return html(head(), body(*c))
 
 def is_deleted(element, pr_child_name):
     for pr in element:
@@ -23,6 +30,57 @@ def is_deleted(element, pr_child_name):
             return False
     return False
 
+def transform_children(docx, kids):
+    """ Transform a sequence of XML elements.
+
+    Returns (css, c), where css is a dict of the style properties found among
+    the kids (or None if there were none) and c is a list of the resulting
+    HTML content.
+    """
+    css = {}
+    c = []
+    def last_is_deleted():
+        if len(c) == 0:
+            return False
+        last = c[-1]
+        return (isinstance(last, Element)
+                and last.name == 'p'
+                and last.style is not None
+                and last.style.get('-ooxml-deleted') == '1')
+
+    def add(ht):
+        if isinstance(ht, dict):
+            css.update(ht)
+        elif isinstance(ht, list):
+            for item in ht:
+                add(item)
+        elif isinstance(ht, str) and c and isinstance(c[-1], str):
+            # Merge adjacent strings.
+            c[-1] += ht
+        elif (isinstance(ht, Element)
+              and c
+              and isinstance(c[-1], Element)
+              and last_is_deleted()):
+            # Merge paragraphs that were joined by deleting the paragraph break.
+            #print("Merging this:\n" + repr(c[-1]) + "into this:\n" + repr(ht))
+            if ht.name == 'p':
+                c[-1] = ht.with_content(c[-1].content + ht.content)
+            else:
+                del c[-1]
+                c.append(ht)
+        elif ht is not None:
+            c.append(ht)
+
+    for k in kids:
+        add(transform_element(docx, k))
+
+    if last_is_deleted():
+        del c[-1]
+
+    if not css:
+        css = None
+    return css, c
+
 def transform_element(docx, e):
     name = shorten(e.tag)
     assert e.tail is None
@@ -91,61 +149,9 @@ def transform_element(docx, e):
         return image
     else:
         assert e.text is None
+        css, c = transform_children(docx, e)
 
-        # Transform all children.
-        css = {}
-        c = []
-        def last_is_deleted():
-            if len(c) == 0:
-                return False
-            last = c[-1]
-            return (isinstance(last, Element)
-                    and last.name == 'p'
-                    and last.style is not None
-                    and last.style.get('-ooxml-deleted') == '1')
-
-        def add(ht):
-            if isinstance(ht, dict):
-                css.update(ht)
-            elif isinstance(ht, list):
-                for item in ht:
-                    add(item)
-            elif isinstance(ht, str) and c and isinstance(c[-1], str):
-                # Merge adjacent strings.
-                c[-1] += ht
-            elif (isinstance(ht, Element)
-                  and c
-                  and isinstance(c[-1], Element)
-                  and last_is_deleted()):
-                # Merge paragraphs that were joined by deleting the paragraph break.
-                #print("Merging this:\n" + repr(c[-1]) + "into this:\n" + repr(ht))
-                if ht.name == 'p':
-                    c[-1] = ht.with_content(c[-1].content + ht.content)
-                else:
-                    del c[-1]
-                    c.append(ht)
-            elif ht is not None:
-                c.append(ht)
-
-        for k in e:
-            add(transform_element(docx, k))
-
-        if last_is_deleted():
-            del c[-1]
-
-        if not css:
-            css = None
-
-        if name == 'document':
-            [body_e] = c
-            return html(
-                head(),
-                body_e)
-
-        elif name == 'body':
-            return body(*c)
-
-        elif name == 'r':
+        if name == 'r':
             if css is None:
                 return c
             else: